@@ -0,0 +1,147 @@
+import numpy as np
+
+try:
+    from numba import njit, prange
+    have_numba = True
+except ImportError:
+    have_numba = False
+
+
+def linear_interp_weights(src, tgt):
+    """Compute linear interpolation indices and weights.
+
+    Parameters
+    ----------
+    src : `np.ndarray`
+        Source grid, shape (nsrc, ).  Must be sorted.
+    tgt : `np.ndarray`
+        Target grid, shape (ntgt, ).
+
+    Returns
+    -------
+    idx : `np.ndarray`
+        Index of the lower bracketing source point, shape (ntgt, ).
+    w : `np.ndarray`
+        Weight of the upper bracketing source point, shape (ntgt, ).
+    """
+    if tgt.size > 0 and (tgt.min() < src[0] or tgt.max() > src[-1]):
+        raise ValueError("Wavelengths out of range of the interpolation table.")
+
+    idx = np.clip(np.searchsorted(src, tgt) - 1, 0, src.size - 2).astype(np.int64)
+    w = (tgt - src[idx])/(src[idx + 1] - src[idx])
+
+    return idx, w
+
+
+def _batch_linear_interp_numpy(idx, w, y, out):
+    """Linearly interpolate many rows from a shared grid, with numpy.
+
+    Negative interpolated values are clipped to zero.
+
+    Parameters
+    ----------
+    idx : `np.ndarray`
+        Interpolation indices, shape (ntgt, ).
+    w : `np.ndarray`
+        Interpolation weights, shape (ntgt, ).
+    y : `np.ndarray`
+        Values to interpolate, shape (nrow, nsrc).
+    out : `np.ndarray`
+        Output array, shape (nrow, ntgt).  Filled in place.
+    """
+    out[:, :] = (1.0 - w)*y[:, idx] + w*y[:, idx + 1]
+    np.maximum(out, 0.0, out=out)
+
+
+def _batch_linear_interp_numba(idx, w, y, out):
+    """Linearly interpolate many rows from a shared grid, with numba.
+
+    The rows are interpolated in parallel when this is compiled with
+    ``parallel=True``, and serially otherwise.  Negative interpolated
+    values are clipped to zero.
+
+    Parameters
+    ----------
+    idx : `np.ndarray`
+        Interpolation indices, shape (ntgt, ).
+    w : `np.ndarray`
+        Interpolation weights, shape (ntgt, ).
+    y : `np.ndarray`
+        Values to interpolate, shape (nrow, nsrc).
+    out : `np.ndarray`
+        Output array, shape (nrow, ntgt).  Filled in place.
+    """
+    for i in prange(y.shape[0]):
+        for k in range(idx.size):
+            out[i, k] = max((1.0 - w[k])*y[i, idx[k]] + w[k]*y[i, idx[k] + 1], 0.0)
+
+
+def _interp_mul_numpy(idx, w, y, scale, out):
+    """Linearly interpolate a row and multiply by a scale, with numpy.
+
+    Negative interpolated values are clipped to zero before the multiply.
+
+    Parameters
+    ----------
+    idx : `np.ndarray`
+        Interpolation indices, shape (ntgt, ).
+    w : `np.ndarray`
+        Interpolation weights, shape (ntgt, ).
+    y : `np.ndarray`
+        Values to interpolate, shape (nsrc, ).
+    scale : `np.ndarray`
+        Values to multiply, shape (ntgt, ).
+    out : `np.ndarray`
+        Output array, shape (ntgt, ).  Filled in place.
+    """
+    out[:] = np.maximum((1.0 - w)*y[idx] + w*y[idx + 1], 0.0)*scale
+
+
+def _interp_mul_numba(idx, w, y, scale, out):
+    """Linearly interpolate a row and multiply by a scale, with numba.
+
+    This is done in a single pass over the output.  Negative interpolated
+    values are clipped to zero before the multiply.
+
+    Parameters
+    ----------
+    idx : `np.ndarray`
+        Interpolation indices, shape (ntgt, ).
+    w : `np.ndarray`
+        Interpolation weights, shape (ntgt, ).
+    y : `np.ndarray`
+        Values to interpolate, shape (nsrc, ).
+    scale : `np.ndarray`
+        Values to multiply, shape (ntgt, ).
+    out : `np.ndarray`
+        Output array, shape (ntgt, ).  Filled in place.
+    """
+    for k in range(idx.size):
+        out[k] = max((1.0 - w[k])*y[idx[k]] + w[k]*y[idx[k] + 1], 0.0)*scale[k]
+
+
+# Explicit signatures for the jitted kernels, so that they are compiled
+# (or loaded from the cache) at import rather than on the first call.
+_batch_linear_interp_signatures = [
+    'void(i8[::1], f8[::1], f4[:, ::1], f4[:, ::1])',
+    'void(i8[::1], f8[::1], f8[:, ::1], f8[:, ::1])',
+]
+_interp_mul_signatures = [
+    'void(i8[::1], f8[::1], f4[::1], f4[::1], f4[::1])',
+    'void(i8[::1], f8[::1], f8[::1], f8[::1], f8[::1])',
+]
+
+# The serial batch kernel is the default.  The parallel variant launches
+# numba's threading layer, which (without tbb or omp) is not safe to call
+# from several python threads at once, so it is only used on request.
+if have_numba:
+    batch_linear_interp = njit(_batch_linear_interp_signatures,
+                               cache=True)(_batch_linear_interp_numba)
+    batch_linear_interp_parallel = njit(_batch_linear_interp_signatures,
+                                        cache=True,
+                                        parallel=True)(_batch_linear_interp_numba)
+    interp_mul = njit(_interp_mul_signatures, cache=True)(_interp_mul_numba)
+else:
+    batch_linear_interp = _batch_linear_interp_numpy
+    batch_linear_interp_parallel = _batch_linear_interp_numpy
+    interp_mul = _interp_mul_numpy
@@ -1,6 +1,8 @@
 import numpy as np
 import fitsio
-import scipy.interpolate as interpolate
+
+from ._kernels import (batch_linear_interp, batch_linear_interp_parallel,
+                       interp_mul, linear_interp_weights)
 
 
 class FgcmDesTransmission(object):
@@ -12,46 +14,90 @@ class FgcmDesTransmission(object):
         File with ccd throughput data.
     atm_file : `str`
         File with atmosphere throughput data.
+    parallel : `bool`, optional
+        Interpolate the per-exposure atmospheres with multiple threads
+        (requires numba).  Only use this from multiple python threads
+        if numba has a thread-safe threading layer (tbb or omp).
     """
-    def __init__(self, ccd_file, atm_file):
+    def __init__(self, ccd_file, atm_file, parallel=False):
+        self._parallel = parallel
+
         self._read_ccd_file(ccd_file)
         self._read_atm_file(atm_file)
 
         # default are the atm wavelengths.
         self._wavelengths = None
         self.set_wavelengths(self._atm_wavelengths)
-        self._std_ifunc = None
 
     def set_wavelengths(self, wavelengths):
         """Set the wavelengths to return for the transmission.
 
-        This will cache interpolation.
+        This will cache interpolation.  The cached throughputs are
+        stored as float32, matching the precision of the input tables.
 
         Parameters
         ----------
         wavelengths : `np.ndarray`
             Wavelength array (Angstroms)
         """
-        if self._wavelengths is not None:
-            if len(wavelengths) == len(self._wavelengths):
-                if np.allclose(wavelengths, self._wavelengths):
-                    # This is a match, we don't need to do anything
-                    return
-
-        self._wavelengths = np.atleast_1d(wavelengths)
+        wavelengths = np.atleast_1d(wavelengths).astype(np.float64)
 
-        # Do ccd interpolation here.
-        self._band_tput_interp = {}
-        self._band_ccd_interp = {}
+        if self._wavelengths is not None:
+            if np.array_equal(wavelengths, self._wavelengths):
+                # This is a match, we don't need to do anything
+                return
+
+        # Compute all the interpolation indices and weights first, so that
+        # a wavelength grid out of range raises before any cached values
+        # are changed.  These are computed once per distinct ccd lambda
+        # grid, which is usually shared by all the bands.
+        ccd_weights = {}
+        band_weights = {}
         for band in self.bands:
-            ifunc = interpolate.interp1d(self._ccd_data[band]['lambda'],
-                                         self._ccd_data[band]['throughput_avg'])
-            self._band_tput_interp[band] = np.clip(ifunc(self._wavelengths), 0.0, 1e100)
-            self._band_ccd_interp[band] = np.zeros((self._wavelengths.size, self.nccd))
-            for j in range(self.nccd):
-                ifunc = interpolate.interp1d(self._ccd_data[band]['lambda'],
-                                             self._ccd_data[band]['throughput_ccd'][:, j])
-                self._band_ccd_interp[band][:, j] = np.clip(ifunc(self._wavelengths), 0.0, 1e100)
+            key = self._ccd_data[band]['lambda'].tobytes()
+            if key not in ccd_weights:
+                ccd_weights[key] = linear_interp_weights(self._ccd_data[band]['lambda'],
+                                                         wavelengths)
+            band_weights[band] = ccd_weights[key]
+        atm_idx, atm_w = linear_interp_weights(self._atm_wavelengths, wavelengths)
+
+        self._wavelengths = wavelengths
+        self._atm_idx = atm_idx
+        self._atm_w = atm_w
+
+        # Do ccd interpolation here.  The interpolated average throughputs
+        # have shape (nband, nwavelength), and the per-ccd throughputs
+        # have shape (nband, nccd, nwavelength).
+        self._tput_interp = np.zeros((len(self.bands), self._wavelengths.size),
+                                     dtype=np.float32)
+        self._ccd_interp = np.zeros((len(self.bands), self.nccd, self._wavelengths.size),
+                                    dtype=np.float32)
+        for band, band_index in self._band_index.items():
+            idx, w = band_weights[band]
+
+            batch_linear_interp(idx,
+                                w,
+                                self._ccd_data[band]['throughput_avg'][None, :],
+                                self._tput_interp[band_index:band_index + 1, :])
+            # All the ccds share the same lambda grid, so they are
+            # interpolated together.
+            batch_linear_interp(idx,
+                                w,
+                                self._ccd_data[band]['throughput_ccd'],
+                                self._ccd_interp[band_index, :, :])
+
+        # Interpolate the atmosphere for all the exposures at once,
+        # with shape (nexposure, nwavelength).
+        self._atm_interp_all = np.zeros((self._atm_throughput.shape[0], self._wavelengths.size),
+                                        dtype=np.float32)
+        if self._parallel:
+            atm_interp = batch_linear_interp_parallel
+        else:
+            atm_interp = batch_linear_interp
+        atm_interp(self._atm_idx,
+                   self._atm_w,
+                   self._atm_throughput,
+                   self._atm_interp_all)
 
     def get_wavelengths(self):
         """Get the wavelengths in the cache.
@@ -63,7 +109,7 @@ class FgcmDesTransmission(object):
         """
         return self._wavelengths
 
-    def get_transmission(self, band, expnum, ccdnum, wavelengths=None):
+    def get_transmission(self, band, expnum, ccdnum, wavelengths=None, out=None):
         """Get the transmission S(lambda).
 
         Return the transmission for a given band, exposure, and ccd.
@@ -79,31 +125,103 @@ class FgcmDesTransmission(object):
         wavelengths : `np.ndarray`, optional
             Set new wavelengths and interpolation; otherwise
             use cached values.  Units are Angstroms.
+        out : `np.ndarray`, optional
+            Array to fill with the transmission, to avoid a new allocation
+            when called in a loop.  Must have the same length as the
+            wavelengths.
 
         Returns
         -------
         transmission : `np.ndarray`
-            Transmission as a function of wavelength.
+            Transmission as a function of wavelength (float32).  This is
+            ``out`` if it was supplied.
         """
         if wavelengths is not None:
             self.set_wavelengths(wavelengths)
 
-        u, = np.where(self._atm_data['expnum'] == expnum)
-        if len(u) == 0:
+        try:
+            row_index = self._expnum_index[expnum]
+        except KeyError:
             raise ValueError(f"Exposure {expnum} not found in atm table.")
 
         ccd_index = ccdnum - 1
         if ccd_index < 0 or ccd_index >= self.nccd:
             raise ValueError(f"ccdnum {ccdnum} out of range.")
 
-        if band not in self._band_ccd_interp:
+        try:
+            band_index = self._band_index[band]
+        except KeyError:
             raise ValueError(f"band {band} not in throughput table.")
 
-        ifunc = interpolate.interp1d(self._atm_wavelengths,
-                                     self._atm_data['throughput'][u[0], :])
-        atm = np.clip(ifunc(self._wavelengths), 0.0, 1e100)
+        if out is not None and out.shape != self._wavelengths.shape:
+            raise ValueError(f"out has shape {out.shape}, expected {self._wavelengths.shape}.")
+
+        return np.multiply(self._atm_interp_all[row_index, :],
+                           self._ccd_interp[band_index, ccd_index, :],
+                           out=out)
+
+    def get_transmission_batch(self, band, expnums, ccdnums, wavelengths=None):
+        """Get the transmission S(lambda) for many exposure/ccd pairs.
+
+        Return the transmission for a given band, and arrays of
+        exposures and ccds.
+
+        Parameters
+        ----------
+        band : `str`
+            Band to get transmission.
+        expnums : `np.ndarray`
+            Exposure numbers to get transmission.
+        ccdnums : `np.ndarray`
+            CCD numbers to get transmission.  Must be broadcastable
+            against expnums (e.g. the same length, or a single value).
+        wavelengths : `np.ndarray`, optional
+            Set new wavelengths and interpolation; otherwise
+            use cached values.  Units are Angstroms.
+
+        Returns
+        -------
+        transmission : `np.ndarray`
+            Transmission as a function of wavelength (float32), with
+            shape (npair, nwavelength).
+        """
+        if wavelengths is not None:
+            self.set_wavelengths(wavelengths)
 
-        return atm*self._band_ccd_interp[band][:, ccd_index]
+        expnums = np.atleast_1d(np.asarray(expnums))
+        ccdnums = np.atleast_1d(np.asarray(ccdnums))
+        if expnums.ndim > 1 or ccdnums.ndim > 1:
+            raise ValueError("expnums and ccdnums must be 1-D.")
+        if expnums.size > 0 and not np.issubdtype(expnums.dtype, np.integer):
+            raise ValueError(f"expnums must be integers, got {expnums.dtype}.")
+        if ccdnums.size > 0 and not np.issubdtype(ccdnums.dtype, np.integer):
+            raise ValueError(f"ccdnums must be integers, got {ccdnums.dtype}.")
+        expnums = expnums.astype(np.int64)
+        ccdnums = ccdnums.astype(np.int64)
+
+        try:
+            expnums, ccdnums = np.broadcast_arrays(expnums, ccdnums)
+        except ValueError:
+            raise ValueError(f"Length of expnums ({expnums.size}) and ccdnums "
+                             f"({ccdnums.size}) do not match.")
+
+        try:
+            row_indices = np.array([self._expnum_index[expnum] for expnum in expnums],
+                                   dtype=np.int64)
+        except KeyError as e:
+            raise ValueError(f"Exposure {e.args[0]} not found in atm table.")
+
+        ccd_indices = ccdnums - 1
+        bad, = np.where((ccd_indices < 0) | (ccd_indices >= self.nccd))
+        if len(bad) > 0:
+            raise ValueError(f"ccdnum {ccdnums[bad[0]]} out of range.")
+
+        try:
+            band_index = self._band_index[band]
+        except KeyError:
+            raise ValueError(f"band {band} not in throughput table.")
+
+        return self._atm_interp_all[row_indices, :]*self._ccd_interp[band_index, ccd_indices, :]
 
     def get_std_transmission(self, band, wavelengths=None):
         """Get the standard transmission S(lambda).
@@ -121,20 +239,24 @@ class FgcmDesTransmission(object):
         Returns
         -------
         std_transmission : `np.ndarray`
-            Standard transmission as a function of wavelength.
+            Standard transmission as a function of wavelength (float32).
         """
-        if self._std_ifunc is None:
-            self._std_ifunc = interpolate.interp1d(self._atm_wavelengths,
-                                                   self._atm_std)
         if wavelengths is not None:
             self.set_wavelengths(wavelengths)
 
-        if band not in self._band_tput_interp:
+        try:
+            band_index = self._band_index[band]
+        except KeyError:
             raise ValueError(f"band {band} not in throughput table.")
 
-        atm = np.clip(self._std_ifunc(self._wavelengths), 0.0, 1e100)
+        std_transmission = np.zeros(self._wavelengths.size, dtype=np.float32)
+        interp_mul(self._atm_idx,
+                   self._atm_w,
+                   self._atm_std,
+                   self._tput_interp[band_index, :],
+                   std_transmission)
 
-        return atm*self._band_tput_interp[band]
+        return std_transmission
 
     def _read_ccd_file(self, ccd_file):
         """Read the ccd file.
@@ -154,10 +276,20 @@ class FgcmDesTransmission(object):
 
                 parts = hdu.get_extname().split('_')
 
-                self._ccd_data[parts[0]] = hdu.read()
+                data = hdu.read(columns=['lambda', 'throughput_avg', 'throughput_ccd'])
+                # Store as native float32 arrays, with the per-ccd throughput
+                # transposed to shape (nccd, nlambda) so that each ccd is
+                # contiguous for interpolation.
+                self._ccd_data[parts[0]] = {
+                    'lambda': data['lambda'].astype(np.float64),
+                    'throughput_avg': np.ascontiguousarray(data['throughput_avg'], dtype=np.float32),
+                    'throughput_ccd': np.ascontiguousarray(data['throughput_ccd'].T, dtype=np.float32),
+                }
                 self.bands.append(parts[0])
                 if self.nccd is None:
-                    self.nccd = self._ccd_data[parts[0]]['throughput_ccd'].shape[1]
+                    self.nccd = self._ccd_data[parts[0]]['throughput_ccd'].shape[0]
+
+        self._band_index = {band: i for i, band in enumerate(self.bands)}
 
     def _read_atm_file(self, atm_file):
         """Read the atmosphere file.
@@ -167,10 +299,14 @@ class FgcmDesTransmission(object):
         atm_file : `str`
             File with atmosphere throughput data.
         """
-        atm_data = fitsio.read(atm_file)
+        atm_data = fitsio.read(atm_file, ext=1, columns=['expnum', 'throughput'])
+        throughput = atm_data['throughput']
         # The 0th row has the wavelengths
-        self._atm_wavelengths = atm_data['throughput'][0, :]
+        self._atm_wavelengths = throughput[0, :].astype(np.float64)
         # The 1st row has the standard atmosphere
-        self._atm_std = atm_data['throughput'][1, :]
-        # And the rest of the rows are per-exposure
-        self._atm_data = atm_data[2:]
+        self._atm_std = np.ascontiguousarray(throughput[1, :], dtype=np.float32)
+        # And the rest of the rows are per-exposure.  These are stored
+        # as contiguous native float32 arrays, not as a table.
+        self._atm_throughput = np.ascontiguousarray(throughput[2:, :], dtype=np.float32)
+        self._atm_expnum = atm_data['expnum'][2:].astype(np.int64)
+        self._expnum_index = {int(expnum): i for i, expnum in enumerate(self._atm_expnum)}
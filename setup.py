@@ -10,7 +10,8 @@ setup(
     author='Eli Rykoff',
     author_email='erykoff@stanford.edu',
     url='https://github.com/erykoff/fdest',
-    install_requires=['numpy', 'fitsio', 'scipy'],
+    install_requires=['numpy', 'fitsio'],
+    extras_require={'full': ['numba']},
     use_scm_version=True,
     setup_requires=['setuptools_scm', 'setuptools_scm_git_archive'],
 )
@@ -1,10 +1,12 @@
 import unittest
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import numpy.testing as testing
 
 import fdest
+from fdest import _kernels
 
 
 ROOT = os.path.abspath(os.path.dirname(__file__))
@@ -53,6 +55,40 @@ class FdestTestCase(unittest.TestCase):
         testing.assert_array_almost_equal(trans.get_wavelengths(),
                                           newest_wavelengths)
 
+        # Update to set with same length, values within allclose tolerance
+        close_wavelengths = newest_wavelengths + 0.01
+        trans.set_wavelengths(close_wavelengths)
+
+        testing.assert_array_equal(trans.get_wavelengths(),
+                                   close_wavelengths)
+
+        # Update to a single wavelength
+        trans.set_wavelengths(5000.0)
+
+        testing.assert_array_equal(trans.get_wavelengths(), [5000.0])
+        self.assertEqual(trans.get_transmission('g', 226650, 1).shape, (1, ))
+
+        # Update to an empty set
+        trans.set_wavelengths(np.array([]))
+
+        self.assertEqual(trans.get_wavelengths().shape, (0, ))
+        self.assertEqual(trans.get_transmission('g', 226650, 1).shape, (0, ))
+        self.assertEqual(trans.get_std_transmission('g').shape, (0, ))
+
+    def test_wavelengths_out_of_range(self):
+        """Test that an out of range wavelength grid is not cached."""
+        trans = fdest.FgcmDesTransmission(self.ccdfile, self.atmfile)
+        wavelengths = trans.get_wavelengths()
+
+        bad_wavelengths = np.arange(2000., 5000., 10.)
+        self.assertRaises(ValueError, trans.set_wavelengths, bad_wavelengths)
+        # A second call with the same grid must still raise.
+        self.assertRaises(ValueError, trans.set_wavelengths, bad_wavelengths)
+
+        testing.assert_array_equal(trans.get_wavelengths(), wavelengths)
+        t = trans.get_transmission('g', 226650, 1)
+        self.assertEqual(t.shape, wavelengths.shape)
+
     def test_get_std_transmission(self):
         """Test getting the standard transmission."""
         trans = fdest.FgcmDesTransmission(self.ccdfile, self.atmfile)
@@ -60,6 +96,7 @@ class FdestTestCase(unittest.TestCase):
         for band in ['g', 'r', 'i', 'z', 'Y']:
             std = trans.get_std_transmission(band)
 
+            self.assertEqual(std.dtype, np.float32)
             testing.assert_almost_equal(std[0], 0.0)
             testing.assert_almost_equal(std[-1], 0.0)
             self.assertGreater(std.max(), 0.5)
@@ -71,10 +108,110 @@ class FdestTestCase(unittest.TestCase):
         for band in ['g', 'r', 'i', 'z', 'Y']:
             t = trans.get_transmission(band, 226650, 1)
 
+            self.assertEqual(t.dtype, np.float32)
             testing.assert_almost_equal(t[0], 0.0)
             testing.assert_almost_equal(t[-1], 0.0)
             self.assertGreater(t.max(), 0.5)
 
+    def test_parallel(self):
+        """Test that parallel atmosphere interpolation matches serial."""
+        trans = fdest.FgcmDesTransmission(self.ccdfile, self.atmfile)
+        trans_parallel = fdest.FgcmDesTransmission(self.ccdfile, self.atmfile, parallel=True)
+
+        wavelengths = np.arange(3000., 11000., 7.3)
+        trans.set_wavelengths(wavelengths)
+        trans_parallel.set_wavelengths(wavelengths)
+
+        testing.assert_array_equal(trans_parallel.get_transmission('g', 226650, 1),
+                                   trans.get_transmission('g', 226650, 1))
+
+    def test_threads(self):
+        """Test using the class from several threads at once."""
+        trans = fdest.FgcmDesTransmission(self.ccdfile, self.atmfile)
+        wavelengths = np.arange(3000., 11000., 7.3)
+        trans.set_wavelengths(wavelengths)
+        expected = trans.get_transmission('r', 226649, 2)
+
+        def _run(i):
+            t = fdest.FgcmDesTransmission(self.ccdfile, self.atmfile)
+            for _ in range(50):
+                t.set_wavelengths(wavelengths + 1.0)
+                t.set_wavelengths(wavelengths)
+            return t.get_transmission('r', 226649, 2)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(_run, range(8)))
+
+        for result in results:
+            testing.assert_array_equal(result, expected)
+
+    def test_get_transmission_out(self):
+        """Test getting transmission into a supplied array."""
+        trans = fdest.FgcmDesTransmission(self.ccdfile, self.atmfile)
+
+        out = np.zeros(trans.get_wavelengths().size, dtype=np.float32)
+        for band in ['g', 'r', 'i', 'z', 'Y']:
+            t = trans.get_transmission(band, 226650, 1, out=out)
+
+            self.assertIs(t, out)
+            testing.assert_array_equal(out, trans.get_transmission(band, 226650, 1))
+
+        self.assertRaises(ValueError, trans.get_transmission, 'g', 226650, 1,
+                          out=np.zeros(10, dtype=np.float32))
+        self.assertRaises(ValueError, trans.get_transmission, 'g', 226650, 1,
+                          out=np.zeros((3, out.size), dtype=np.float32))
+
+    def test_get_transmission_batch(self):
+        """Test getting transmission for many exposure/ccd pairs."""
+        trans = fdest.FgcmDesTransmission(self.ccdfile, self.atmfile)
+
+        expnums = np.array([226650, 226648, 226650, 226649])
+        ccdnums = np.array([1, 2, 2, 1])
+
+        for band in ['g', 'r', 'i', 'z', 'Y']:
+            t = trans.get_transmission_batch(band, expnums, ccdnums)
+
+            self.assertEqual(t.dtype, np.float32)
+            self.assertEqual(t.shape, (len(expnums), trans.get_wavelengths().size))
+            for i in range(len(expnums)):
+                testing.assert_array_equal(t[i, :],
+                                           trans.get_transmission(band, expnums[i], ccdnums[i]))
+
+        # A single ccd is broadcast to all the exposures.
+        t = trans.get_transmission_batch('g', expnums, 1)
+        for i in range(len(expnums)):
+            testing.assert_array_equal(t[i, :], trans.get_transmission('g', expnums[i], 1))
+
+        self.assertRaises(ValueError, trans.get_transmission_batch, 'k', expnums, ccdnums)
+        self.assertRaises(ValueError, trans.get_transmission_batch, 'g', [226650, 1000000], 1)
+        self.assertRaises(ValueError, trans.get_transmission_batch, 'g', expnums, [1, 2, 3, 100])
+
+    def test_get_transmission_batch_shapes(self):
+        """Test getting transmission for empty and broadcast inputs."""
+        trans = fdest.FgcmDesTransmission(self.ccdfile, self.atmfile)
+        nwave = trans.get_wavelengths().size
+
+        t = trans.get_transmission_batch('g', [], [])
+        self.assertEqual(t.shape, (0, nwave))
+
+        t = trans.get_transmission_batch('g', [226650], [])
+        self.assertEqual(t.shape, (0, nwave))
+
+        # A single exposure is broadcast to all the ccds.
+        t = trans.get_transmission_batch('g', 226650, [1, 2])
+        self.assertEqual(t.shape, (2, nwave))
+        for i, ccdnum in enumerate([1, 2]):
+            testing.assert_array_equal(t[i, :], trans.get_transmission('g', 226650, ccdnum))
+
+        self.assertRaises(ValueError, trans.get_transmission_batch, 'g',
+                          [226650, 226649], [1, 2, 1])
+        self.assertRaises(ValueError, trans.get_transmission_batch, 'g',
+                          np.array([[226650, 226649]]), 1)
+        self.assertRaises(ValueError, trans.get_transmission_batch, 'g', [226650.7], [1])
+        self.assertRaises(ValueError, trans.get_transmission_batch, 'g', [226650], [1.9])
+        self.assertRaises(ValueError, trans.get_transmission_batch, 'g', ['226650'], [1])
+        self.assertRaises(ValueError, trans.get_transmission_batch, 'g', [226650], ['1'])
+
     def test_get_illegal_transmissions(self):
         """Test getting transmissions for values out of range."""
         trans = fdest.FgcmDesTransmission(self.ccdfile, self.atmfile)
@@ -84,6 +221,45 @@ class FdestTestCase(unittest.TestCase):
         self.assertRaises(ValueError, trans.get_transmission, 'g', 1000000, 1)
         self.assertRaises(ValueError, trans.get_transmission, 'g', 226650, 100)
 
+    def test_batch_linear_interp(self):
+        """Test the batch interpolation kernels against np.interp."""
+        src = np.linspace(3000.0, 11000.0, 101)
+        tgt = np.linspace(3000.0, 11000.0, 333)
+        rng = np.random.RandomState(12345)
+        y = rng.uniform(low=-0.1, high=1.0, size=(5, src.size))
+
+        expected = np.array([np.interp(tgt, src, row) for row in y])
+        expected[expected < 0.0] = 0.0
+
+        idx, w = _kernels.linear_interp_weights(src, tgt)
+
+        for func in [_kernels._batch_linear_interp_numpy, _kernels.batch_linear_interp]:
+            out = np.zeros((y.shape[0], tgt.size))
+            func(idx, w, y, out)
+            testing.assert_array_almost_equal(out, expected)
+
+        self.assertRaises(ValueError, _kernels.linear_interp_weights, src, tgt - 1.0)
+        self.assertRaises(ValueError, _kernels.linear_interp_weights, src, tgt + 1.0)
+
+    def test_interp_mul(self):
+        """Test the interpolate-and-multiply kernels against np.interp."""
+        src = np.linspace(3000.0, 11000.0, 101)
+        tgt = np.linspace(3000.0, 11000.0, 333)
+        rng = np.random.RandomState(12345)
+        y = rng.uniform(low=-0.1, high=1.0, size=src.size)
+        scale = rng.uniform(size=tgt.size)
+
+        expected = np.interp(tgt, src, y)
+        expected[expected < 0.0] = 0.0
+        expected *= scale
+
+        idx, w = _kernels.linear_interp_weights(src, tgt)
+
+        for func in [_kernels._interp_mul_numpy, _kernels.interp_mul]:
+            out = np.zeros(tgt.size)
+            func(idx, w, y, scale, out)
+            testing.assert_array_almost_equal(out, expected)
+
 
 if __name__ == '__main__':
     unittest.main()